@@ -0,0 +1,35 @@
+"""
+Multi-worker entry point: python -m app
+Kept out of app/main.py so spawned workers import the application once.
+"""
+import glob
+import os
+import tempfile
+
+import uvicorn
+
+if __name__ == "__main__":
+    # Defaults to one worker: os.cpu_count() reports the host's cores, not
+    # the container's CPU limit, and every worker holds its own model copy
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+    if workers > 1:
+        # Workers write metrics to a shared directory that /metrics
+        # aggregates (prometheus_client multiprocess mode); it must be
+        # set before any worker imports prometheus_client
+        metrics_dir = os.environ.setdefault(
+            "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus-")
+        )
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(path)
+
+    # Each worker process loads its own copy of the model in lifespan
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="uvloop",
+        http="httptools"
+    )
@@ -0,0 +1,371 @@
+"""
+Model runtimes for the inference service.
+Each runtime exposes the scikit-learn classifier interface used by the API.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # pragma: no cover - optional runtime
+    ort = None
+
+try:
+    import numba
+except ImportError:  # pragma: no cover - optional runtime
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'app/model.joblib'
+ONNX_MODEL_PATH = 'app/model.onnx'
+# One of: auto, numba, onnx, sklearn
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'auto')
+
+
+class OnnxClassifier:
+    """Serve an ONNX-exported classifier through ONNX Runtime."""
+
+    def __init__(self, path: str):
+        options = ort.SessionOptions()
+        # Single-sample requests gain nothing from intra-op parallelism
+        options.intra_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.n_features_in_ = model_input.shape[1]
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.classes_ = np.array(json.loads(metadata['classes']))
+
+    def _run(self, X):
+        features = np.asarray(X, dtype=np.float32)
+        return self.session.run(None, {self.input_name: features})
+
+    def predict(self, X):
+        return self._run(X)[0]
+
+    def predict_proba(self, X):
+        return self._run(X)[1]
+
+
+def _forest_proba(X, feature, threshold, left, right, value):
+    """Average the leaf class distributions of every tree for each row of X."""
+    n_trees = feature.shape[0]
+    n_classes = value.shape[2]
+    out = np.zeros((X.shape[0], n_classes))
+    for i in range(X.shape[0]):
+        for t in range(n_trees):
+            node = 0
+            while left[t, node] != -1:
+                if X[i, feature[t, node]] <= threshold[t, node]:
+                    node = left[t, node]
+                else:
+                    node = right[t, node]
+            for c in range(n_classes):
+                out[i, c] += value[t, node, c]
+        for c in range(n_classes):
+            out[i, c] /= n_trees
+    return out
+
+
+if numba is not None:
+    _forest_proba = numba.njit(cache=True, fastmath=True)(_forest_proba)
+
+
+def _round_down_float32(values):
+    """
+    Convert float64 thresholds to the largest float32 not above them.
+
+    Inputs are float32, so x <= t holds exactly when x <= the rounded-down
+    threshold; rounding to nearest could send ties down the wrong branch.
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def _is_forest(model):
+    return hasattr(model, 'estimators_') and all(
+        hasattr(tree, 'tree_') for tree in model.estimators_
+    )
+
+
+class CompiledForest:
+    """Serve a scikit-learn tree ensemble through a numba-compiled traversal."""
+
+    def __init__(self, model):
+        if numba is None:
+            raise ImportError("numba is required for the numba backend")
+        if not _is_forest(model):
+            raise ValueError(f"Cannot compile {type(model).__name__}: not a tree ensemble")
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_nodes = max(tree.node_count for tree in trees)
+        n_classes = len(model.classes_)
+
+        # Pad every tree to the same node count so they stack into 2-D arrays.
+        # float32/int32 halves the cache footprint of the float64/int64
+        # arrays scikit-learn keeps.
+        self.feature = np.zeros((len(trees), n_nodes), dtype=np.int32)
+        self.threshold = np.zeros((len(trees), n_nodes), dtype=np.float32)
+        self.left = np.full((len(trees), n_nodes), -1, dtype=np.int32)
+        self.right = np.full((len(trees), n_nodes), -1, dtype=np.int32)
+        self.value = np.zeros((len(trees), n_nodes, n_classes), dtype=np.float32)
+        for t, tree in enumerate(trees):
+            count = tree.node_count
+            self.feature[t, :count] = tree.feature
+            self.threshold[t, :count] = _round_down_float32(tree.threshold)
+            self.left[t, :count] = tree.children_left
+            self.right[t, :count] = tree.children_right
+            # Normalize leaves to class distributions, as predict_proba does
+            value = tree.value[:, 0, :]
+            self.value[t, :count] = value / value.sum(axis=1, keepdims=True)
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def predict_proba(self, X):
+        return _forest_proba(
+            np.asarray(X, dtype=np.float32),
+            self.feature, self.threshold, self.left, self.right, self.value
+        )
+
+
+class GeneratedForest:
+    """
+    Serve a scikit-learn tree ensemble as generated Python source.
+
+    Each tree is unrolled into an if/else ladder over scalar arguments
+    f0..fN with its leaf distributions (pre-divided by the number of
+    trees) inlined as constants, so a row is scored without any array
+    indexing. Used when numba is unavailable.
+    """
+
+    # Each tree level nests one block; CPython rejects source indented
+    # 100 levels deep, and the enclosing def takes one of them
+    MAX_DEPTH = 90
+
+    def __init__(self, model):
+        if not self.supports(model):
+            raise ValueError(
+                f"Cannot generate code for {type(model).__name__}: not a tree "
+                f"ensemble of depth <= {self.MAX_DEPTH}"
+            )
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        self.source = self._generate(model)
+        namespace = {}
+        exec(compile(self.source, '<generated forest>', 'exec'), namespace)
+        self._predict_row = namespace['predict_row']
+
+    @classmethod
+    def supports(cls, model):
+        return _is_forest(model) and all(
+            estimator.tree_.max_depth <= cls.MAX_DEPTH for estimator in model.estimators_
+        )
+
+    @staticmethod
+    def _generate(model):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_classes = len(model.classes_)
+        args = ", ".join(f"f{i}" for i in range(model.n_features_in_))
+        lines = []
+
+        def emit(tree, node, depth):
+            indent = "    " * depth
+            if tree.children_left[node] == -1:
+                value = tree.value[node, 0]
+                value = value / value.sum() / len(trees)
+                lines.append(f"{indent}return ({', '.join(repr(float(v)) for v in value)},)")
+                return
+            lines.append(
+                f"{indent}if f{tree.feature[node]} <= {float(tree.threshold[node])!r}:"
+            )
+            emit(tree, tree.children_left[node], depth + 1)
+            lines.append(f"{indent}else:")
+            emit(tree, tree.children_right[node], depth + 1)
+
+        for t, tree in enumerate(trees):
+            lines.append(f"def tree_{t}({args}):")
+            emit(tree, 0, 1)
+            lines.append("")
+
+        totals = [f"p{c}" for c in range(n_classes)]
+        lines.append(f"def predict_row({args}):")
+        lines.append(f"    {' = '.join(totals)} = 0.0")
+        for t in range(len(trees)):
+            lines.append(f"    v = tree_{t}({args})")
+            lines.append("    " + "; ".join(f"p{c} += v[{c}]" for c in range(n_classes)))
+        lines.append(f"    return ({', '.join(totals)},)")
+        return "\n".join(lines) + "\n"
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def predict_proba(self, X):
+        # Round through float32 like the fitted trees do before comparing
+        rows = np.asarray(X, dtype=np.float32).tolist()
+        return np.array([self._predict_row(*row) for row in rows])
+
+
+def load_model(backend: str = MODEL_BACKEND):
+    """
+    Load the model with the requested runtime.
+
+    'auto' compiles the forest with numba when available, then prefers
+    the ONNX export, then generated Python code for forests shallow
+    enough to compile, and otherwise serves the joblib model directly.
+    """
+    if backend == 'auto' and numba is None and ort is not None and os.path.exists(ONNX_MODEL_PATH):
+        backend = 'onnx'
+    if backend == 'onnx':
+        logger.info("Using ONNX Runtime model: %s", ONNX_MODEL_PATH)
+        return OnnxClassifier(ONNX_MODEL_PATH)
+    if backend not in ('auto', 'numba', 'codegen', 'sklearn'):
+        raise ValueError(f"Unknown model backend: {backend}")
+
+    model = joblib.load(MODEL_PATH)
+    if backend == 'auto':
+        if not _is_forest(model):
+            backend = 'sklearn'
+        elif numba is not None:
+            backend = 'numba'
+        elif GeneratedForest.supports(model):
+            backend = 'codegen'
+        else:
+            backend = 'sklearn'
+    if backend == 'numba':
+        logger.info("Using numba-compiled forest: %s", MODEL_PATH)
+        return CompiledForest(model)
+    if backend == 'codegen':
+        logger.info("Using generated forest code: %s", MODEL_PATH)
+        return GeneratedForest(model)
+    logger.info("Using scikit-learn model: %s", MODEL_PATH)
+    return model
+
+
+class PredictionCache:
+    """Least-recently-used cache of (prediction, confidence) by feature vector."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PredictionBatcher:
+    """
+    Coalesce concurrent single-vector predictions into one model call.
+
+    Requests are queued with a future; a background task drains up to
+    max_batch of them (waiting at most max_wait seconds for stragglers,
+    and only when more requests arrived after the first was queued),
+    runs the model once on the stacked features and resolves each future
+    with its (prediction, confidence) row. confidence is None when the
+    model doesn't support predict_proba.
+    """
+
+    def __init__(self, model, max_batch: int = 64, max_wait: float = 0.002):
+        self.model = model
+        # Resolved once; estimators hide predict_proba when unsupported
+        self.has_proba = hasattr(model, 'predict_proba')
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+        # Reused float32 input matrix; sized on the first batch
+        self._buffer = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def warmup(self):
+        """Score one dummy row so first-call costs (e.g. JIT compilation) are paid now."""
+        self._predict_batch([[0.0] * self.model.n_features_in_])
+
+    async def predict(self, features):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((features, future))
+        return await future
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch:
+                # Yield once so requests already in flight can enqueue; only
+                # wait for stragglers when that shows there is contention
+                queued = len(batch)
+                await asyncio.sleep(0)
+                self._drain(batch)
+                if queued < len(batch) < self.max_batch and self.max_wait > 0:
+                    await asyncio.sleep(self.max_wait)
+                    self._drain(batch)
+
+            try:
+                results = self._predict_batch([features for features, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _predict_batch(self, rows):
+        n_features = len(rows[0])
+        if self._buffer is None or self._buffer.shape[1] != n_features:
+            self._buffer = np.empty((self.max_batch, n_features), dtype=np.float32)
+        X = self._buffer[:len(rows)]
+        for i, row in enumerate(rows):
+            X[i] = row
+        if not self.has_proba:
+            return [(int(label), None) for label in self.model.predict(X)]
+        probabilities = self.model.predict_proba(X)
+        # The label is the argmax of the probabilities
+        best = np.argmax(probabilities, axis=1)
+        labels = self.model.classes_[best].tolist()
+        # float32 tree averages can round a hair above 1.0
+        confidences = np.minimum(probabilities[np.arange(len(rows)), best], 1.0).tolist()
+        return list(zip(labels, confidences))
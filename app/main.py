@@ -3,31 +3,64 @@ ML Inference Service
 A production-ready REST API for serving machine learning predictions.
 """
 import logging
+import os
+import queue
 import time
-from typing import List, Dict, Any
+from logging.handlers import QueueHandler, QueueListener
+from typing import Annotated, List, Dict, Any, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel, Field
+import msgspec
 import numpy as np
-import joblib
-from prometheus_client import Counter, Histogram, Gauge, generate_latest
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, Gauge, multiprocess
+from prometheus_client.exposition import choose_encoder
 from fastapi.responses import Response
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from app.inference import PredictionBatcher, PredictionCache, load_model
+
+# Logging; records are written by a background listener thread so the
+# event loop never blocks on stream I/O. Installed during lifespan.
+log_queue = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 )
+log_listener = QueueListener(log_queue, _stream_handler)
+_queue_handler = QueueHandler(log_queue)
 logger = logging.getLogger(__name__)
 
+
+def start_queue_logging() -> bool:
+    """Route root logging through the queue unless root is already configured."""
+    # Like logging.basicConfig, leave an existing root configuration alone
+    if logging.root.handlers:
+        return False
+    logging.root.setLevel(logging.INFO)
+    logging.root.addHandler(_queue_handler)
+    log_listener.start()
+    return True
+
+
+def stop_queue_logging():
+    """Detach the queue handler and flush pending records."""
+    logging.root.removeHandler(_queue_handler)
+    log_listener.stop()
+
 # Prometheus metrics
 REQUEST_COUNT = Counter(
     'inference_requests_total',
     'Total inference requests',
     ['status', 'endpoint']
 )
+# Bind label children once instead of resolving labels() on every request
+HEALTH_SUCCESS = REQUEST_COUNT.labels(status='success', endpoint='health')
+READY_SUCCESS = REQUEST_COUNT.labels(status='success', endpoint='ready')
+READY_ERROR = REQUEST_COUNT.labels(status='error', endpoint='ready')
+PREDICT_SUCCESS = REQUEST_COUNT.labels(status='success', endpoint='predict')
+PREDICT_ERROR = REQUEST_COUNT.labels(status='error', endpoint='predict')
 REQUEST_LATENCY = Histogram(
     'inference_request_duration_seconds',
     'Inference request latency',
@@ -38,31 +71,84 @@ PREDICTION_DISTRIBUTION = Histogram(
     'Distribution of prediction values',
     buckets=[0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
 )
-MODEL_VERSION = Gauge('model_version_info', 'Model version information')
+MODEL_VERSION = Gauge(
+    'model_version_info',
+    'Model version information',
+    multiprocess_mode='max'
+)
+
+# With several workers (python -m app), each process writes its metrics to
+# PROMETHEUS_MULTIPROC_DIR and /metrics aggregates all of them
+if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    METRICS_REGISTRY = CollectorRegistry()
+    multiprocess.MultiProcessCollector(METRICS_REGISTRY)
+else:
+    METRICS_REGISTRY = REGISTRY
+
+# Rendered exposition per content type, reused across scrapes for this long
+METRICS_CACHE_TTL = 1.0
+_metrics_cache = {}
+
+
+class _Holder:
+    """Global model state; slots make the per-request attribute reads cheap."""
+    __slots__ = ("model", "batcher", "version")
+
+    def __init__(self):
+        self.model = None
+        self.batcher = None
+        self.version = "1.0.0"
+
 
 # Global model holder
-model_holder = {"model": None, "version": "1.0.0"}
+holder = _Holder()
 
+# Number of distinct feature vectors whose predictions are memoized
+PREDICTION_CACHE_SIZE = 4096
+prediction_cache = PredictionCache(maxsize=PREDICTION_CACHE_SIZE)
 
-class PredictionRequest(BaseModel):
+# Micro-batching of concurrent predictions
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "2"))
+
+
+class PredictionRequest(msgspec.Struct):
     """Request schema for predictions."""
-    features: List[float] = Field(
-        ...,
+    features: Annotated[List[float], msgspec.Meta(
         description="Feature vector for prediction",
-        min_items=4,
-        max_items=4
-    )
-    request_id: str = Field(
-        default=None,
+        min_length=4,
+        max_length=4
+    )]
+    request_id: Annotated[Optional[str], msgspec.Meta(
         description="Optional request ID for tracking"
-    )
+    )] = None
 
-    @validator('features')
-    def validate_features(cls, v):
-        """Ensure features are valid numbers."""
-        if any(np.isnan(x) or np.isinf(x) for x in v):
-            raise ValueError("Features cannot contain NaN or Inf values")
-        return v
+
+# Request bodies are decoded by msgspec, so document the schema explicitly
+_, _request_schemas = msgspec.json.schema_components([PredictionRequest])
+PREDICTION_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": _request_schemas["PredictionRequest"]}
+        }
+    }
+}
+
+
+def decode_prediction_request(body: bytes) -> PredictionRequest:
+    """Decode and validate a prediction request body."""
+    try:
+        # strict=False keeps accepting numeric strings, as Pydantic did
+        request = msgspec.json.decode(body, type=PredictionRequest, strict=False)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not np.isfinite(np.asarray(request.features, dtype=np.float64)).all():
+        raise HTTPException(
+            status_code=422,
+            detail="Features cannot contain NaN or Inf values"
+        )
+    return request
 
 
 class PredictionResponse(BaseModel):
@@ -70,7 +156,7 @@ class PredictionResponse(BaseModel):
     prediction: int = Field(..., description="Predicted class")
     confidence: float = Field(..., description="Prediction confidence")
     model_version: str = Field(..., description="Model version used")
-    request_id: str = Field(default=None, description="Request tracking ID")
+    request_id: Optional[str] = Field(default=None, description="Request tracking ID")
 
 
 class HealthResponse(BaseModel):
@@ -83,21 +169,38 @@ class HealthResponse(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle manager for the application."""
-    # Startup: Load model
+    # Startup: Start log writer and load model
+    queue_logging = start_queue_logging()
     logger.info("Loading ML model...")
     try:
-        model = joblib.load('app/model.joblib')
-        model_holder["model"] = model
+        model = load_model()
+        holder.model = model
+        prediction_cache.clear()
+        batcher = PredictionBatcher(
+            model,
+            max_batch=BATCH_MAX_SIZE,
+            max_wait=BATCH_MAX_WAIT_MS / 1000
+        )
+        batcher.warmup()
+        batcher.start()
+        holder.batcher = batcher
         MODEL_VERSION.set(1)
-        logger.info(f"Model loaded successfully. Version: {model_holder['version']}")
+        logger.info("Model loaded successfully. Version: %s", holder.version)
     except Exception as e:
-        logger.error(f"Failed to load model: {e}")
+        logger.error("Failed to load model: %s", e)
+        if queue_logging:
+            stop_queue_logging()
         raise
     
     yield
     
     # Shutdown
     logger.info("Shutting down inference service...")
+    await holder.batcher.stop()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+    if queue_logging:
+        stop_queue_logging()
 
 
 # Initialize FastAPI app
@@ -105,21 +208,23 @@ app = FastAPI(
     title="ML Inference Service",
     description="Production-ready machine learning inference API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Log all requests and track latency."""
-    start_time = time.time()
+    start_time = time.perf_counter()
     response = await call_next(request)
-    duration = time.time() - start_time
     
-    logger.info(
-        f"Method={request.method} Path={request.url.path} "
-        f"Status={response.status_code} Duration={duration:.3f}s"
-    )
+    if logger.isEnabledFor(logging.INFO):
+        duration = time.perf_counter() - start_time
+        logger.info(
+            "Method=%s Path=%s Status=%s Duration=%.3fs",
+            request.method, request.url.path, response.status_code, duration
+        )
     
     return response
 
@@ -130,11 +235,11 @@ async def health_check():
     Health check endpoint for liveness probe.
     Returns 200 if service is alive.
     """
-    REQUEST_COUNT.labels(status='success', endpoint='health').inc()
+    HEALTH_SUCCESS.inc()
     return HealthResponse(
         status="healthy",
-        model_loaded=model_holder["model"] is not None,
-        model_version=model_holder["version"]
+        model_loaded=holder.model is not None,
+        model_version=holder.version
     )
 
 
@@ -144,79 +249,90 @@ async def readiness_check():
     Readiness check endpoint for readiness probe.
     Returns 200 only if model is loaded and ready to serve.
     """
-    if model_holder["model"] is None:
-        REQUEST_COUNT.labels(status='error', endpoint='ready').inc()
+    if holder.model is None:
+        READY_ERROR.inc()
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    REQUEST_COUNT.labels(status='success', endpoint='ready').inc()
+    READY_SUCCESS.inc()
     return HealthResponse(
         status="ready",
         model_loaded=True,
-        model_version=model_holder["version"]
+        model_version=holder.version
     )
 
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(request: PredictionRequest):
+@app.post(
+    "/predict",
+    responses={200: {"model": PredictionResponse}},
+    openapi_extra=PREDICTION_REQUEST_BODY
+)
+async def predict(http_request: Request):
     """
     Main prediction endpoint.
     
     Args:
-        request: PredictionRequest with features
+        http_request: Raw request whose body is a PredictionRequest
         
     Returns:
-        PredictionResponse with prediction and confidence
+        Dict shaped like PredictionResponse with prediction and confidence
     """
+    request = decode_prediction_request(await http_request.body())
+    
     with REQUEST_LATENCY.time():
         try:
             # Check model availability
-            if model_holder["model"] is None:
-                REQUEST_COUNT.labels(status='error', endpoint='predict').inc()
+            if holder.model is None:
+                PREDICT_ERROR.inc()
                 raise HTTPException(status_code=503, detail="Model not loaded")
             
-            # Prepare features
-            features = np.array(request.features).reshape(1, -1)
-            
-            # Make prediction
-            prediction = int(model_holder["model"].predict(features)[0])
-            
-            # Get prediction probabilities for confidence
-            try:
-                probabilities = model_holder["model"].predict_proba(features)[0]
-                confidence = float(max(probabilities))
-                PREDICTION_DISTRIBUTION.observe(confidence)
-            except AttributeError:
-                # Model doesn't support predict_proba
+            key = tuple(request.features)
+            result = prediction_cache.get(key)
+            if result is None:
+                result = await holder.batcher.predict(request.features)
+                prediction_cache.put(key, result)
+            prediction, confidence = result
+            if confidence is None:
                 confidence = 1.0
+            else:
+                PREDICTION_DISTRIBUTION.observe(confidence)
             
-            REQUEST_COUNT.labels(status='success', endpoint='predict').inc()
+            PREDICT_SUCCESS.inc()
             
             logger.info(
-                f"Prediction successful - Request: {request.request_id}, "
-                f"Prediction: {prediction}, Confidence: {confidence:.3f}"
+                "Prediction successful - Request: %s, Prediction: %s, Confidence: %.3f",
+                request.request_id, prediction, confidence
             )
             
-            return PredictionResponse(
-                prediction=prediction,
-                confidence=confidence,
-                model_version=model_holder["version"],
-                request_id=request.request_id
-            )
+            # Returned as a plain dict; PredictionResponse only documents it
+            return {
+                "prediction": prediction,
+                "confidence": confidence,
+                "model_version": holder.version,
+                "request_id": request.request_id
+            }
             
         except ValueError as e:
-            REQUEST_COUNT.labels(status='error', endpoint='predict').inc()
-            logger.error(f"Validation error: {e}")
+            PREDICT_ERROR.inc()
+            logger.error("Validation error: %s", e)
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
-            REQUEST_COUNT.labels(status='error', endpoint='predict').inc()
-            logger.error(f"Prediction error: {e}")
+            PREDICT_ERROR.inc()
+            logger.error("Prediction error: %s", e)
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @app.get("/metrics")
-async def metrics():
+async def metrics(request: Request):
     """Prometheus metrics endpoint."""
-    return Response(content=generate_latest(), media_type="text/plain")
+    # Serves OpenMetrics to scrapers that ask for it, text format otherwise
+    encoder, content_type = choose_encoder(request.headers.get("accept"))
+    now = time.monotonic()
+    cached = _metrics_cache.get(content_type)
+    if cached is None or now - cached[0] >= METRICS_CACHE_TTL:
+        cached = (now, encoder(METRICS_REGISTRY))
+        _metrics_cache[content_type] = cached
+    # Passed as a header: content_type already carries its charset
+    return Response(content=cached[1], headers={"Content-Type": content_type})
 
 
 @app.get("/")
@@ -233,8 +349,3 @@ async def root():
             "docs": "/docs"
         }
     }
-
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
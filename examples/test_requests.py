@@ -1,16 +1,27 @@
 """
-Example usage of the ML Inference Service using Python requests.
+Example usage of the ML Inference Service using httpx.
 """
-import requests
+import asyncio
 import json
+import random
+import time
 from typing import List
 
+import httpx
+
 API_URL = "http://localhost:8000"
 
+# One long-lived client so every call reuses a keep-alive connection
+client = httpx.Client(
+    base_url=API_URL,
+    timeout=5.0,
+    limits=httpx.Limits(max_keepalive_connections=10)
+)
+
 
 def health_check():
     """Check if service is healthy."""
-    response = requests.get(f"{API_URL}/health")
+    response = client.get("/health")
     print(f"Health Check: {response.status_code}")
     print(json.dumps(response.json(), indent=2))
     return response.json()
@@ -18,7 +29,7 @@ def health_check():
 
 def ready_check():
     """Check if service is ready to serve."""
-    response = requests.get(f"{API_URL}/ready")
+    response = client.get("/ready")
     print(f"Ready Check: {response.status_code}")
     print(json.dumps(response.json(), indent=2))
     return response.json()
@@ -30,10 +41,10 @@ def predict(features: List[float], request_id: str = None):
         "features": features,
         "request_id": request_id
     }
-    response = requests.post(f"{API_URL}/predict", json=payload)
+    response = client.post("/predict", json=payload)
     print(f"Prediction Request: {request_id or 'No ID'}")
     print(f"Status: {response.status_code}")
-    if response.ok:
+    if response.is_success:
         result = response.json()
         print(json.dumps(result, indent=2))
         return result
@@ -42,6 +53,27 @@ def predict(features: List[float], request_id: str = None):
         return None
 
 
+async def benchmark(features: List[float], n_requests: int = 200):
+    """Send concurrent predictions over a shared async connection pool."""
+    # Jitter every vector so requests miss the service's prediction cache
+    payloads = [
+        {
+            "features": [x + random.uniform(-0.05, 0.05) for x in features],
+            "request_id": f"benchmark-{i:03d}"
+        }
+        for i in range(n_requests)
+    ]
+    async with httpx.AsyncClient(base_url=API_URL, timeout=5.0) as async_client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(async_client.post("/predict", json=payload) for payload in payloads)
+        )
+        elapsed = time.perf_counter() - start
+    succeeded = sum(response.is_success for response in responses)
+    print(f"   {succeeded}/{n_requests} succeeded in {elapsed:.3f}s "
+          f"({n_requests / elapsed:.0f} req/s)")
+
+
 def main():
     """Run example requests."""
     print("=" * 50)
@@ -98,6 +130,13 @@ def main():
         print(f"   Caught exception: {e}")
     print()
     
+    # Concurrent throughput example
+    print("7. Concurrent Predictions")
+    asyncio.run(benchmark(features=[5.1, 3.5, 1.4, 0.2]))
+    print()
+    
+    client.close()
+    
     print("=" * 50)
     print("All examples completed!")
     print("=" * 50)
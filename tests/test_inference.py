@@ -0,0 +1,133 @@
+"""
+Tests for the model runtimes and prediction batcher.
+Every runtime must reproduce the scikit-learn model's probabilities.
+"""
+import asyncio
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+
+from app import inference
+from app.inference import (
+    CompiledForest,
+    GeneratedForest,
+    OnnxClassifier,
+    PredictionBatcher,
+    _round_down_float32,
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    return joblib.load(inference.MODEL_PATH)
+
+
+@pytest.fixture(scope="module")
+def iris_rows():
+    return load_iris().data.astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def split_rows(model, iris_rows):
+    """Rows sitting on, just below and just above every split threshold."""
+    base = iris_rows.mean(axis=0)
+    rows = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        for node in np.flatnonzero(tree.children_left != -1):
+            below = _round_down_float32(tree.threshold[node:node + 1])[0]
+            for value in (
+                np.nextafter(below, np.float32(-np.inf)),
+                below,
+                np.nextafter(below, np.float32(np.inf)),
+            ):
+                row = base.copy()
+                row[tree.feature[node]] = value
+                rows.append(row)
+    return np.array(rows, dtype=np.float32)
+
+
+def _runtimes():
+    runtimes = [pytest.param(GeneratedForest, id="codegen")]
+    if inference.numba is not None:
+        runtimes.append(pytest.param(CompiledForest, id="numba"))
+    if inference.ort is not None:
+        runtimes.append(pytest.param(
+            lambda model: OnnxClassifier(inference.ONNX_MODEL_PATH), id="onnx"
+        ))
+    return runtimes
+
+
+@pytest.mark.parametrize("make_runtime", _runtimes())
+@pytest.mark.parametrize("rows", ["iris_rows", "split_rows"])
+def test_runtime_matches_sklearn(make_runtime, rows, model, request):
+    X = request.getfixturevalue(rows)
+    runtime = make_runtime(model)
+
+    np.testing.assert_array_equal(runtime.classes_, model.classes_)
+    assert runtime.n_features_in_ == model.n_features_in_
+    np.testing.assert_allclose(
+        runtime.predict_proba(X), model.predict_proba(X), atol=1e-5
+    )
+    np.testing.assert_array_equal(runtime.predict(X), model.predict(X))
+
+
+def test_round_down_float32():
+    values = np.array([0.1, 0.5, 2.45, 1.0 / 3.0])
+    rounded = _round_down_float32(values)
+
+    assert rounded.dtype == np.float32
+    assert (rounded.astype(np.float64) <= values).all()
+    above = np.nextafter(rounded, np.float32(np.inf))
+    assert (above.astype(np.float64) > values).all()
+
+
+def test_generated_forest_rejects_deep_trees(model):
+    assert GeneratedForest.supports(model)
+
+    deep = joblib.load(inference.MODEL_PATH)
+    deep.estimators_[0].tree_ = type("Tree", (), {
+        "max_depth": GeneratedForest.MAX_DEPTH + 1
+    })()
+    assert not GeneratedForest.supports(deep)
+    with pytest.raises(ValueError):
+        GeneratedForest(deep)
+
+
+def test_batcher_returns_each_request_its_own_row(model, iris_rows):
+    probabilities = model.predict_proba(iris_rows)
+    expected_labels = model.classes_[np.argmax(probabilities, axis=1)].tolist()
+    expected_confidences = probabilities.max(axis=1)
+
+    async def run():
+        # A small max_batch splits the concurrent requests across batches
+        batcher = PredictionBatcher(model, max_batch=16, max_wait=0.001)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                *(batcher.predict(row.tolist()) for row in iris_rows)
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(run())
+
+    assert [label for label, _ in results] == expected_labels
+    np.testing.assert_allclose(
+        [confidence for _, confidence in results], expected_confidences, atol=1e-6
+    )
+
+
+def test_batcher_propagates_model_errors(model):
+    async def run():
+        batcher = PredictionBatcher(model)
+        batcher.start()
+        try:
+            return await batcher.predict([1.0, 2.0])
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -2,7 +2,12 @@
 Simple model training script.
 Trains a basic classifier on the Iris dataset and saves it.
 """
+import json
+import os
+
 import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
 from sklearn.datasets import load_iris
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
@@ -20,9 +25,11 @@ def train_model():
     )
     
     print("Training model...")
+    # Inference cost grows linearly with the number of trees; a small,
+    # shallow forest is as accurate as a large one on Iris
     model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=5,
+        n_estimators=int(os.environ.get("N_ESTIMATORS", "20")),
+        max_depth=int(os.environ.get("MAX_DEPTH", "3")),
         random_state=42
     )
     model.fit(X_train, y_train)
@@ -42,6 +49,21 @@ def train_model():
     print("\nSaving model...")
     joblib.dump(model, 'app/model.joblib')
     print("Model saved to app/model.joblib")
+
+    # Export to ONNX for the serving runtime; pin the opsets so the file
+    # loads with the onnxruntime version in requirements.txt
+    onnx_model = convert_sklearn(
+        model,
+        initial_types=[('input', FloatTensorType([None, X.shape[1]]))],
+        options={id(model): {'zipmap': False}},
+        target_opset={'': 17, 'ai.onnx.ml': 3}
+    )
+    classes = onnx_model.metadata_props.add()
+    classes.key = 'classes'
+    classes.value = json.dumps(model.classes_.tolist())
+    with open('app/model.onnx', 'wb') as f:
+        f.write(onnx_model.SerializeToString())
+    print("Model exported to app/model.onnx")
     
     return model
 